@@ -1,16 +1,18 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import folium
 import numpy as np
 from streamlit_folium import st_folium
 import plotly.express as px
 import plotly.graph_objects as go
-from folium.plugins import MarkerCluster
-from PIL import Image
+from folium.plugins import FastMarkerCluster
 import os
+import json
+import logging
 import colorsys
 import matplotlib.colors as mcolors
-from scipy.spatial import KDTree
+from scipy.spatial import cKDTree
 from folium.features import DivIcon
 from sklearn.preprocessing import MinMaxScaler
 import random
@@ -24,30 +26,140 @@ st.set_page_config(
     layout="wide"
 )
 
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = 'Metadata ALL - Sheet.xlsx'
+KEEP_COLS = [
+    'id_station', 'name_station', 'nama_propinsi', 'nama_kota', 'kecamatan', 'kelurahan', 'latt_station', 'long_station', 'elv_station', 'status_operasional', 'hp_petugas', 'tgl_pasang', 'addr_instansi', 'data_transport', 'instansi', 'nama_vendor'
+]
+CACHE_DIR = '.cache'
+# Naikkan bila read_metadata_workbook berubah (dtype, konversi kolom) agar cache Parquet lama diabaikan
+CACHE_VERSION = 1
+# Kolom bantu hasil load_site_metadata yang tidak ikut diekspor
+INTERNAL_COLS = ['popup_html', 'tooltip_html', '_search_blob', 'id_station_str', 'display']
+CATEGORY_COLS = [
+    'JENIS', 'nama_propinsi', 'nama_kota', 'kecamatan', 'kelurahan', 'nama_vendor', 'status_operasional', 'data_transport', 'instansi'
+]
+
 # --- LOAD DATA ---
+def read_metadata_workbook(file_path):
+    """Parse every sheet of the metadata workbook into one DataFrame."""
+    sheets = pd.read_excel(
+        file_path,
+        sheet_name=None,
+        engine='calamine',
+        usecols=KEEP_COLS,
+        dtype={'id_station': str, 'hp_petugas': str}
+    )
+
+    # Gabungkan semua sheet; nama sheet menjadi kolom JENIS
+    df = pd.concat(sheets, names=['JENIS', None]).reset_index(level='JENIS')
+
+    # Elevasi bercampur angka & teks antar sheet (mis. '150', '-'); jadikan numerik (non-angka -> NaN)
+    # agar kolom bertipe tunggal dan bisa disimpan ke Parquet
+    df['elv_station'] = pd.to_numeric(df['elv_station'], errors='coerce')
+
+    return df.dropna(subset=['latt_station', 'long_station']).reset_index(drop=True)
+
+def load_raw_metadata(file_path):
+    """Return the combined workbook data, using an on-disk Parquet copy when it is up to date."""
+    cache_path = os.path.join(CACHE_DIR, 'metadata.parquet')
+    meta_path = os.path.join(CACHE_DIR, 'metadata.meta')
+
+    # Cache dianggap valid bila mtime & ukuran file Excel serta skema hasil read_metadata_workbook
+    # (CACHE_VERSION & KEEP_COLS) sama dengan saat cache dibuat
+    stat = os.stat(file_path)
+    source_meta = {
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'version': CACHE_VERSION,
+        'columns': KEEP_COLS
+    }
+
+    try:
+        with open(meta_path) as f:
+            cached_meta = json.load(f)
+        if cached_meta == source_meta:
+            return pd.read_parquet(cache_path, engine='pyarrow')
+    except FileNotFoundError:
+        pass  # Cache belum ada, baca dari Excel
+    except Exception as e:
+        logger.warning("Ignoring unreadable metadata cache %s: %s", cache_path, e)
+
+    df = read_metadata_workbook(file_path)
+
+    # Simpan cache; kegagalan cache tidak boleh menghentikan aplikasi
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(cache_path, engine='pyarrow', compression='zstd')
+        with open(meta_path, 'w') as f:
+            json.dump(source_meta, f)
+
+        # Hapus cache format lama (metadata_<mtime|sha1>.parquet)
+        for name in os.listdir(CACHE_DIR):
+            if name.startswith('metadata_') and name.endswith('.parquet'):
+                os.remove(os.path.join(CACHE_DIR, name))
+    except Exception as e:
+        logger.warning("Could not write metadata cache %s: %s", cache_path, e)
+
+    return df
+
 @st.cache_data
-def load_site_metadata():
-    """Load site metadata from CSV"""
+def load_site_metadata(data_version=None):
+    """Load site metadata from the Excel workbook; data_version only keys the cache"""
     try:
         # --- Memuat Data ---
-        file_path = 'Metadata ALL - Sheet.xlsx'
-        xls = pd.ExcelFile(file_path)
-        sheets = {
-            name: pd.read_excel(file_path, sheet_name=name, dtype={'hp_petugas': str})
-            for name in xls.sheet_names
-        }
+        file_path = METADATA_FILE
+        df = load_raw_metadata(file_path)
+
+        # Siapkan konten popup & tooltip marker sekali saja (vektorisasi)
+        install_date = df['tgl_pasang'].dt.strftime("%m/%d/%Y").fillna('N/A')
+        name_str = df['name_station'].fillna('N/A').astype(str)
+        id_str = df['id_station'].fillna('N/A').astype(str)
+        df['popup_html'] = (
+            '<div style="width: 300px;">'
+            '<h4>' + name_str + '</h4>'
+            '<hr>'
+            '<b>Site ID:</b> ' + id_str + '<br>'
+            '<b>Province:</b> ' + df['nama_propinsi'].fillna('N/A').astype(str) + '<br>'
+            '<b>District:</b> ' + df['nama_kota'].fillna('N/A').astype(str) + '<br>'
+            '<b>Coordinates:</b> ' + df['latt_station'].map('{:.3f}'.format)
+            + ', ' + df['long_station'].map('{:.3f}'.format) + '<br>'
+            '<b>Elevation:</b> ' + df['elv_station'].map(safe_format_elevation) + ' m <br>'
+            '<b>Installation Year:</b> ' + install_date + '<br>'
+            '<b>Equipment:</b> ' + df['nama_vendor'].fillna('N/A').astype(str) + '<br>'
+            '<b>Address:</b> ' + df['addr_instansi'].fillna('N/A').astype(str)
+            + '</div>'
+        )
+        df['tooltip_html'] = (
+            name_str + ' (ID: ' + id_str + ')'
+        )
 
-        # Ambil dan gabungkan data dari semua sheet
-        dfs = {
-            sheet: xls.parse(sheet)[[
-                'id_station', 'name_station', 'nama_propinsi', 'nama_kota', 'kecamatan', 'kelurahan', 'latt_station', 'long_station', 'elv_station', 'status_operasional', 'hp_petugas', 'tgl_pasang', 'addr_instansi', 'data_transport', 'instansi', 'nama_vendor'
-            ]].dropna(subset=['latt_station', 'long_station']).assign(JENIS=sheet)
-            for sheet in sheets
-        }
+        # ID sebagai string & label dropdown "ID - Nama"
+        df['id_station_str'] = id_str
+        df['display'] = id_str + ' - ' + name_str
+
+        # Format tanggal DD/MM/YYYY untuk tabel & detail stasiun
+        df['tgl_pasang_str'] = df['tgl_pasang'].dt.strftime('%d/%m/%Y').fillna('N/A')
+
+        # Gabungan kolom pencarian (nama, provinsi, kota) dalam huruf kecil untuk Station Directory
+        df['_search_blob'] = (
+            df['name_station'].fillna('').astype(str) + '|'
+            + df['nama_propinsi'].fillna('').astype(str) + '|'
+            + df['nama_kota'].fillna('').astype(str)
+        ).str.lower()
+
+        # Kolom teks berulang disimpan sebagai category agar hemat memori & cepat dibandingkan
+        for col in CATEGORY_COLS:
+            df[col] = df[col].astype('category')
+
+        # Elevasi cukup float32 (selalu ditampilkan lewat safe_format_elevation);
+        # koordinat tetap float64 karena panel detail menampilkannya apa adanya
+        df['elv_station'] = pd.to_numeric(df['elv_station'], downcast='float')
+
+        # Urutkan sekali berdasarkan ID agar Station Directory tidak perlu sort setiap rerun
+        df = df.sort_values('id_station', kind='stable').reset_index(drop=True)
 
-        # Gabungkan semua data
-        df = pd.concat(dfs.values(), ignore_index=True)
-        
         return df
 
     except Exception as e:
@@ -55,12 +167,42 @@ def load_site_metadata():
         return None
 
 def safe_format_elevation(value):
+    if pd.isna(value):
+        return "N/A"
     try:
         return f"{float(value):.3f}"
     except (ValueError, TypeError):
         return "N/A"
 
-def create_clustered_map(df, selected_station_type='AAWS'):
+@st.cache_data
+def province_palette(provinces):
+    """Map each province name to a hex colour from the Plotly Alphabet palette."""
+    palette = px.colors.qualitative.Alphabet
+    return {province: palette[i % len(palette)] for i, province in enumerate(provinces)}
+
+def prepare_clustered_markers(filtered_df):
+    """Return [(province, [[lat, lon, popup, tooltip, color], ...]), ...] for the clustered map."""
+
+    # --- Assign unique hex colors per province ---
+    # Categories are the sorted provinces of the whole dataset, so colours stay stable across station types
+    province_hex = province_palette(tuple(filtered_df['nama_propinsi'].cat.categories))
+    filtered_df = filtered_df.assign(color=filtered_df['nama_propinsi'].map(province_hex))
+
+    # --- Single pass over province-sorted rows; a province change starts a new cluster layer ---
+    filtered_df = filtered_df.dropna(subset=['nama_propinsi']).sort_values('nama_propinsi', kind='stable')
+    columns = ['nama_propinsi', 'latt_station', 'long_station', 'popup_html', 'tooltip_html', 'color']
+
+    province_layers = []
+    current_province = None
+    for province, *row in filtered_df[columns].itertuples(index=False, name=None):
+        if province != current_province:
+            current_province = province
+            province_layers.append((province, []))
+        province_layers[-1][1].append(row)
+
+    return province_layers
+
+def create_clustered_map(province_layers):
     """Create a clustered map with individual markers color-coded by province using unique hex colors."""
 
     # --- Base map setup ---
@@ -70,59 +212,54 @@ def create_clustered_map(df, selected_station_type='AAWS'):
     folium.TileLayer('OpenStreetMap').add_to(m)
     folium.TileLayer('CartoDB positron').add_to(m)
 
-    # --- Filter by selected station type ---
-    filtered_df = df[df['JENIS'] == selected_station_type].copy()
-
-    # --- Assign unique hex colors per province ---
-    provinces = sorted(filtered_df['nama_propinsi'].dropna().unique())
-    hex_palette = px.colors.qualitative.Alphabet
-    color_pool = hex_palette * ((len(provinces) // len(hex_palette)) + 1)
-    province_hex = {
-        province: color_pool[i]
-        for i, province in enumerate(provinces)
+    # Each province is one FastMarkerCluster layer; the browser builds the circle markers
+    # from a single data array instead of one folium.CircleMarker per station
+    marker_callback = """
+    function (row) {
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+            radius: 6, color: row[4], fill: true, fillColor: row[4], fillOpacity: 0.9
+        });
+        marker.bindPopup(row[2], {maxWidth: 350});
+        marker.bindTooltip(row[3]);
+        return marker;
     }
+    """
 
-    # --- Group by province and add clustered markers ---
-    grouped = filtered_df.groupby('nama_propinsi')
-
-    for province, group in grouped:
-        color = province_hex[province]
-        cluster_group = folium.FeatureGroup(name=province)
-        cluster = MarkerCluster().add_to(cluster_group)
-
-        for _, site in group.iterrows():
-            popup_content = f"""
-            <div style="width: 300px;">
-                <h4>{site['name_station']}</h4>
-                <hr>
-                <b>Site ID:</b> {site['id_station']}<br>
-                <b>Province:</b> {site['nama_propinsi']}<br>
-                <b>District:</b> {site['nama_kota']}<br>
-                <b>Coordinates:</b> {site['latt_station']:.3f}, {site['long_station']:.3f}<br>
-                <b>Elevation:</b> {safe_format_elevation(site['elv_station'])} m <br>
-                <b>Installation Year:</b> {site['tgl_pasang'].strftime("%m/%d/%Y") if pd.notna(site['tgl_pasang']) else 'N/A'}<br>
-                <b>Equipment:</b> {site['nama_vendor'] if pd.notna(site['nama_vendor']) else 'N/A'}<br>
-                <b>Address:</b> {site['addr_instansi'] if pd.notna(site['addr_instansi']) else 'N/A'}
-            </div>
-            """
-            folium.CircleMarker(
-                location=[site['latt_station'], site['long_station']],
-                radius=6,
-                color=color,
-                fill=True,
-                fill_color=color,
-                fill_opacity=0.9,
-                popup=folium.Popup(popup_content, max_width=350),
-                tooltip=f"{site['name_station']} (ID: {site['id_station']})"
-            ).add_to(cluster)
-
-        cluster_group.add_to(m)
+    for province, marker_data in province_layers:
+        FastMarkerCluster(marker_data, callback=marker_callback, name=province).add_to(m)
 
     folium.LayerControl(collapsed=True).add_to(m)
     return m
 
-def create_selective_map(df, selected_station_type='AAWS', selected_id_station='10001'):
-    """Create an interactive map centered on Indonesia showing stations of the selected type and highlighting the selected station."""
+def prepare_selective_markers(filtered_df, selected_id_station='10001'):
+    """Return (GeoJSON features of the other stations, [[lat, lon, popup, tooltip], ...] of the selected station)."""
+    selected_id_str = str(selected_id_station)
+    is_selected = filtered_df['id_station_str'] == selected_id_str
+    type_df = filtered_df[~is_selected]
+
+    # Stations of the selected type go to the browser as one GeoJSON FeatureCollection
+    # instead of one folium.Marker each
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"popup": popup_html, "tooltip": tooltip_html}
+        }
+        for lat, lon, popup_html, tooltip_html in zip(
+            type_df['latt_station'].to_numpy(dtype=float),
+            type_df['long_station'].to_numpy(dtype=float),
+            type_df['popup_html'].to_numpy(),
+            type_df['tooltip_html'].to_numpy()
+        )
+    ]
+    selected_rows = filtered_df.loc[
+        is_selected, ['latt_station', 'long_station', 'popup_html', 'tooltip_html']
+    ].values.tolist()
+
+    return features, selected_rows
+
+def create_selective_map(features, selected_rows):
+    """Create an interactive map centered on Indonesia showing the prepared station markers and highlighting the selected station."""
 
     # --- Center map on Indonesia ---
     center_lat = -2.5
@@ -141,82 +278,143 @@ def create_selective_map(df, selected_station_type='AAWS', selected_id_station='
     ).add_to(m)
 
     # --- Add markers ---
-    for idx, site in df.iterrows():
-        site_id_str = str(site['id_station'])
-        selected_id_str = str(selected_id_station)
-
-        # Decide marker style
-        if site_id_str == selected_id_str:
-            color = 'red'
-            icon = 'star'
-        elif site['JENIS'] == selected_station_type:
-            color = 'blue'
-            icon = 'info-sign'
-        else:
-            continue  # Skip stations outside selected type
-
-        # Handle possible missing date or address
-        if pd.notna(site.get('tgl_pasang')) and hasattr(site['tgl_pasang'], 'strftime'):
-            install_date = site['tgl_pasang'].strftime("%m/%d/%Y")
-        else:
-            install_date = 'N/A'
-
-        popup_content = f"""
-        <div style="width: 300px;">
-            <h4>{site['name_station']}</h4>
-            <hr>
-            <b>Site ID:</b> {site_id_str}<br>
-            <b>Province:</b> {site.get('nama_propinsi', 'N/A')}<br>
-            <b>District:</b> {site.get('nama_kota', 'N/A')}<br>
-            <b>Coordinates:</b> {site['latt_station']:.3f}, {site['long_station']:.3f}<br>
-            <b>Elevation:</b> {safe_format_elevation(site['elv_station'])} m <br>
-            <b>Installation Year:</b> {install_date}<br>
-            <b>Equipment:</b> {site.get('nama_vendor', 'N/A')}<br>
-            <b>Address:</b> {site.get('addr_instansi', 'N/A')}
-        </div>
-        """
+    if features:  # GeoJsonPopup/Tooltip read their fields from the first feature
+        folium.GeoJson(
+            {"type": "FeatureCollection", "features": features},
+            name='Stations',
+            marker=folium.Marker(icon=folium.Icon(color='blue', icon='info-sign', prefix='glyphicon')),
+            popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=350),
+            tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False)
+        ).add_to(m)
 
+    # Selected station stays a regular marker on top of the other stations
+    for lat, lon, popup_html, tooltip_html in selected_rows:
         folium.Marker(
-            location=[site['latt_station'], site['long_station']],
-            popup=folium.Popup(popup_content, max_width=350),
-            tooltip=f"{site['name_station']} (ID: {site_id_str})",
-            icon=folium.Icon(color=color, icon=icon, prefix='glyphicon')
+            location=[lat, lon],
+            popup=folium.Popup(popup_html, max_width=350),
+            tooltip=tooltip_html,
+            icon=folium.Icon(color='red', icon='star', prefix='glyphicon')
         ).add_to(m)
 
     folium.LayerControl().add_to(m)
     
     return m
     
-def create_province_distribution_chart(df):
+def get_data_version():
+    """Return a token that changes whenever the metadata workbook is edited."""
+    try:
+        return os.path.getmtime(METADATA_FILE)
+    except OSError:
+        return None
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_map_marker_data(_filtered_df, view_mode, selected_station_type, selected_id_station, data_version):
+    """Prepare the marker payload once per (mode, type, selected site, data version)."""
+    if view_mode == "Individual Markers":
+        return prepare_selective_markers(_filtered_df, selected_id_station)
+    return prepare_clustered_markers(_filtered_df)
+
+def build_map(view_mode, marker_data):
+    """Build a fresh folium Map from cached marker data.
+
+    Map objects are never cached: rendering one appends to its scripts, which changes
+    the st_folium component hash and remounts the map (losing the clicked marker).
+    """
+    if view_mode == "Individual Markers":
+        return create_selective_map(*marker_data)
+    return create_clustered_map(marker_data)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_cached_map_html(_filtered_df, view_mode, selected_station_type, selected_id_station, data_version):
+    """Render the map to a standalone HTML page for display-only embedding."""
+    marker_data = get_map_marker_data(_filtered_df, view_mode, selected_station_type, selected_id_station, data_version)
+    return build_map(view_mode, marker_data).get_root().render()
+
+@st.cache_resource
+def build_station_tree(_df, data_version):
+    """Build a spatial index over station coordinates for nearest-station lookups."""
+    coords = _df[['latt_station', 'long_station']].to_numpy(dtype=float)
+    return cKDTree(coords)
+
+@st.cache_resource
+def build_site_index(_df, data_version):
+    """Map each station ID string to the row position of its first occurrence."""
+    site_index = {}
+    for pos, sid in enumerate(_df['id_station_str'].to_numpy()):
+        site_index.setdefault(sid, pos)
+    return site_index
+
+@st.cache_resource
+def load_file_bytes(path, mtime):
+    """Read a file once per version (mtime) for display/download; returns None if the file is missing."""
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+@st.cache_data
+def compute_summary(_df, data_version):
+    """Aggregate network-wide statistics that only depend on the loaded data."""
+    return {
+        'total': len(_df),
+        'type_counts': _df['JENIS'].value_counts().sort_index(),
+        'province_counts': _df['nama_propinsi'].value_counts(),
+        'vendor_counts': _df.dropna(subset=['nama_vendor'])['nama_vendor'].value_counts(),
+        'n_prov': _df['nama_propinsi'].nunique(),
+        'n_kota': _df['nama_kota'].nunique(),
+        'n_kec': _df['kecamatan'].nunique(),
+        'lat_min': _df['latt_station'].min(),
+        'lat_max': _df['latt_station'].max(),
+        'lon_min': _df['long_station'].min(),
+        'lon_max': _df['long_station'].max(),
+        'earliest': _df['tgl_pasang'].min()
+    }
+
+@st.cache_data
+def create_province_distribution_chart(province_counts):
     """Create bar chart showing Station distribution by province"""
-    province_counts = df['nama_propinsi'].value_counts()
-    
-    fig = px.bar(
-        x=province_counts.values,
-        y=province_counts.index,
-        orientation='h',
-        title="Stations Distribution by Province",
-        labels={'x': 'Number of Sites', 'y': 'Province'},
-        color=province_counts.values,
-        color_continuous_scale='viridis'
+    counts = province_counts.sort_values()
+
+    # Single bar trace with precomputed viridis colours (no per-value traces / colour axis)
+    span = counts.max() - counts.min()
+    norm = (counts.to_numpy() - counts.min()) / (span if span else 1)
+    colors = px.colors.sample_colorscale('viridis', norm.tolist())
+
+    fig = go.Figure(
+        go.Bar(
+            x=counts.values,
+            y=counts.index.astype(str),
+            orientation='h',
+            marker_color=colors
+        )
     )
-    
+
     fig.update_layout(
+        title="Stations Distribution by Province",
+        xaxis_title='Number of Sites',
+        yaxis_title='Province',
         height=600,
         showlegend=False,
+        transition_duration=0,
         yaxis={'categoryorder': 'total ascending'}
     )
-    
+
     return fig
 
-def create_equipment_distribution_chart(df):
-    """Create pie chart showing equipment brand distribution"""
-    df_clean = df.dropna(subset=['nama_vendor'])
-    brand_counts = df_clean['nama_vendor'].value_counts()
+@st.cache_data
+def create_equipment_distribution_chart(brand_counts, top_n=10):
+    """Create pie chart showing equipment brand distribution (top vendors plus an "Other" slice)"""
+    counts = brand_counts.sort_values(ascending=False)
+    counts.index = counts.index.astype(str)
+
+    top = counts.head(top_n)
+    other = counts.iloc[top_n:].sum()
+    if other > 0:
+        top = pd.concat([top, pd.Series({'Other': other})])
     
     fig = px.pie(
-        values=brand_counts.values,
-        names=brand_counts.index,
+        values=top.values,
+        names=top.index,
         title="Vendor Distribution",
         color_discrete_sequence=px.colors.qualitative.Set3
     )
@@ -226,20 +424,25 @@ def create_equipment_distribution_chart(df):
     return fig
 
 @st.cache_data
-def get_filtered_data(df, station_type):
-    """Return filtered site data by station type."""
-    return df[df["JENIS"] == station_type].copy()
+def get_filtered_data(_df, station_type, data_version):
+    """Return filtered site data by station type plus a {id_station_str: dropdown position} map."""
+    sub = _df[_df["JENIS"] == station_type]
+    id_to_pos = {sid: i for i, sid in enumerate(sub['id_station_str'].to_numpy())}
+    return sub, id_to_pos
 
 def main():
     st.title("🗺️ Indonesia Observation Network")
     st.markdown("---")
     
     # Load combined site metadata
-    df = load_site_metadata()
+    data_version = get_data_version()
+    df = load_site_metadata(data_version)
     
     if df is None:
         return
 
+    summary = compute_summary(df, data_version)
+
     # Initialize session state
     if "selected_id_station" not in st.session_state:
         st.session_state.selected_id_station = "10001"  # default site ID as string
@@ -256,7 +459,7 @@ def main():
         "IKRO": "🌱"    # Micro Climate
     }
 
-    type_counts = df['JENIS'].value_counts().sort_index()
+    type_counts = summary['type_counts']
 
     for station_type, count in type_counts.items():
         icon = type_icons.get(station_type, "📡")
@@ -266,27 +469,18 @@ def main():
     st.sidebar.header("🧭 Station Filtering")
 
     # ✅ Use radio for selecting station type
-    station_types = df["JENIS"].unique().tolist()
+    station_types = df["JENIS"].cat.categories.tolist()
     selected_type = st.sidebar.radio("Select Station Type", station_types)
 
     # Filter sites based on selected station type
-    filtered_df = get_filtered_data(df, selected_type)
-
-    # Build display names for dropdown
-    filtered_df["id_station_str"] = filtered_df["id_station"].astype(str)
-    filtered_df["display"] = filtered_df["id_station_str"] + " - " + filtered_df["name_station"]
+    filtered_df, id_to_pos = get_filtered_data(df, selected_type, data_version)
 
     # Recalculate default index from session_state
     selected_id_str = st.session_state.selected_id_station
     filtered_display_list = filtered_df["display"].tolist()
 
     if not filtered_df.empty:
-        try:
-            default_index = filtered_df[filtered_df['id_station_str'] == selected_id_str].index[0]
-            # Convert index to position in the filtered list
-            default_index = filtered_df.index.get_loc(default_index)
-        except (IndexError, KeyError):
-            default_index = 0
+        default_index = id_to_pos.get(selected_id_str, 0)
 
         selected_site_display = st.sidebar.selectbox(
             "Select Site for Detailed Analysis:",
@@ -309,19 +503,20 @@ def main():
         st.sidebar.warning("No sites available for the selected station type.")
         st.info("Please select a different station type.")
     
-    # Main content tabs
-    tab1, tab2, tab3, tab4 = st.tabs(["🗺️ Interactive Map", "🎯 Static Map", "📊 Statistics", "📋 Station Directory"])
+    # Main content views; unlike st.tabs only the active view runs, so reruns elsewhere don't rebuild the map
+    view_labels = ["🗺️ Interactive Map", "🎯 Static Map", "📊 Statistics", "📋 Station Directory"]
+    active_view = st.radio("View", view_labels, horizontal=True, key="active_view", label_visibility="collapsed")
     
-    with tab1:
+    if active_view == view_labels[0]:
         st.subheader("🌍 Indonesia Observation Sites Map")
 
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Sites", len(df))
+            st.metric("Total Sites", summary['total'])
         with col2:
-            st.metric("Provinces Covered", df['nama_propinsi'].nunique())
+            st.metric("Provinces Covered", summary['n_prov'])
         with col3:
-            earliest_date = df['tgl_pasang'].min()
+            earliest_date = summary['earliest']
             formatted_date = earliest_date.strftime('%d/%m/%Y') if pd.notna(earliest_date) else "N/A"
             st.metric("Active Since", formatted_date)
 
@@ -329,20 +524,37 @@ def main():
         
         view_mode = st.radio("🗺️ Map Mode", ["Individual Markers", "Clustered Markers"], horizontal=True)
 
+        # Click selection is only offered on the individual-marker map
         if view_mode == "Individual Markers":
-            map_obj = create_selective_map(
-                df=df,
-                selected_station_type=selected_type,
-                selected_id_station=selected_id
-            )
+            click_capture = st.toggle("🖱️ Select stations by clicking the map", value=True)
         else:
-            map_obj = create_clustered_map(
-                df=df,
-                selected_station_type=selected_type
-            )
+            click_capture = False
+
+        # Clustered view does not depend on the selected site, so keep it out of the map key
+        map_key = (
+            view_mode,
+            selected_type,
+            selected_id if view_mode == "Individual Markers" else None,
+            data_version
+        )
 
+        map_data = None
         with st.container():
-            map_data = st_folium(map_obj, use_container_width=True, height=500)
+            if click_capture:
+                map_obj = build_map(view_mode, get_map_marker_data(filtered_df, *map_key))
+                # Only the clicked marker is read back. streamlit-folium mixes the key into a hash of
+                # the generated script, so the map stays mounted only because build_map returns an
+                # identical fresh Map on each rerun; the key just separates the per-type maps.
+                map_data = st_folium(
+                    map_obj,
+                    use_container_width=True,
+                    height=500,
+                    returned_objects=["last_object_clicked"],
+                    key=f"folmap_{selected_type}_{view_mode}"
+                )
+            else:
+                # Display-only: the rendered HTML is cached per map key
+                components.html(get_cached_map_html(filtered_df, *map_key), height=500)
 
         st.markdown("---")
         
@@ -354,9 +566,9 @@ def main():
                 clicked_lat = last_clicked["lat"]
                 clicked_lon = last_clicked["lng"]
 
-                clicked_station = df.loc[
-                    ((df['latt_station'] - clicked_lat) ** 2 + (df['long_station'] - clicked_lon) ** 2).idxmin()
-                ]
+                tree = build_station_tree(df, data_version)
+                _, nearest_pos = tree.query([clicked_lat, clicked_lon])
+                clicked_station = df.iloc[nearest_pos]
 
         # Show clicked info and selection button BETWEEN the map and image
         with st.container():
@@ -365,8 +577,12 @@ def main():
                 if st.button("🔄 Use this station in selection"):
                     st.session_state.selected_id_station = str(clicked_station['id_station'])
                     st.rerun()
-            else:
+            elif click_capture:
                 st.info("🖱️ Click a station marker on the map to select it to enable selection.")
+            elif view_mode == "Individual Markers":
+                st.info("🖱️ Turn on map click selection above to pick a station from the map.")
+            else:
+                st.info("🖱️ Switch to Individual Markers to pick a station from the map.")
         
         # Legend
         st.markdown("""
@@ -377,7 +593,7 @@ def main():
         """)
 
         # Get selected site details
-        selected_site = df[df['id_station'] == selected_id_station].iloc[0]
+        selected_site = df.iloc[build_site_index(df, data_version)[selected_id_station]]
         raw_phone = selected_site['hp_petugas']
         if pd.notna(raw_phone):
             phone_str = str(raw_phone).strip()
@@ -411,11 +627,11 @@ def main():
             **Coordinates:**
             - **Latitude:** {selected_site['latt_station']:}°
             - **Longitude:** {selected_site['long_station']:}°
-            - **Elevation:** {selected_site['elv_station']} m
+            - **Elevation:** {safe_format_elevation(selected_site['elv_station'])} m
             
             **Administrative:**
             - **Agency:** {selected_site['instansi'] if pd.notna(selected_site['instansi']) else ''}
-            - **Procurement Date:** {selected_site['tgl_pasang'].strftime("%m/%d/%Y")}
+            - **Procurement Date:** {selected_site['tgl_pasang_str']}
             - **Vendor:** {selected_site['nama_vendor']}            
             - **Officer Phone Number:** {phone_str}   
             
@@ -423,19 +639,17 @@ def main():
             {selected_site['addr_instansi'] if pd.notna(selected_site['addr_instansi']) else 'N/A'}
             """)
 
-    with tab2:
+    if active_view == view_labels[1]:
         st.subheader(f"🎯 Static Map for Selected Station Type")
         
         # Show static image map after interaction
         with st.container():
             image_filename = f"Layout {selected_type}.png"
-            if os.path.isfile(image_filename):
-                img = Image.open(image_filename)
-                img = img.resize((1200, int(img.height * 1200 / img.width)))
-                st.image(img, caption="Static Map")
+            image_mtime = os.path.getmtime(image_filename) if os.path.isfile(image_filename) else 0
+            image_data = load_file_bytes(image_filename, image_mtime)
+            if image_data is not None:
+                st.image(image_data, width=1200, caption="Static Map")
 
-                with open(image_filename, "rb") as f:
-                    image_data = f.read()
                 st.download_button(
                     label="📥 Download Image (PNG)",
                     data=image_data,
@@ -445,16 +659,16 @@ def main():
             else:
                 st.warning(f"Image not found: {image_filename}")
 
-    with tab3:
+    if active_view == view_labels[2]:
         st.subheader("📈 Network Statistics")
         
         col1, col2 = st.columns(2)
         
         with col1:
-            st.plotly_chart(create_province_distribution_chart(df), use_container_width=True)
+            st.plotly_chart(create_province_distribution_chart(summary['province_counts']), use_container_width=True)
         
         with col2:
-            st.plotly_chart(create_equipment_distribution_chart(df), use_container_width=True)
+            st.plotly_chart(create_equipment_distribution_chart(summary['vendor_counts']), use_container_width=True)
         
         # Summary statistics
         st.subheader("📊 Network Summary")
@@ -464,42 +678,35 @@ def main():
         with col1:
             st.info(f"""
             **Geographic Coverage:**
-            - **Northernmost:** {df['latt_station'].max():.3f}°
-            - **Southernmost:** {df['latt_station'].min():.3f}°
-            - **Easternmost:** {df['long_station'].max():.3f}°
-            - **Westernmost:** {df['long_station'].min():.3f}°
+            - **Northernmost:** {summary['lat_max']:.3f}°
+            - **Southernmost:** {summary['lat_min']:.3f}°
+            - **Easternmost:** {summary['lon_max']:.3f}°
+            - **Westernmost:** {summary['lon_min']:.3f}°
             """)
         
         with col2:
             st.info(f"""
             **Administrative Coverage:**
-            - **Provinces:** {df['nama_propinsi'].nunique()}
-            - **Districts:** {df['nama_kota'].nunique()}
-            - **Sub-districts:** {df['kecamatan'].nunique()}
+            - **Provinces:** {summary['n_prov']}
+            - **Districts:** {summary['n_kota']}
+            - **Sub-districts:** {summary['n_kec']}
             """)
     
-    with tab4:
+    if active_view == view_labels[3]:
         st.subheader("📋 Complete Station Directory")
         
         # Search functionality
         search_term = st.text_input("🔍 Search station by name or location:")
         
         if search_term:
-            search_df = df[
-                df['name_station'].str.contains(search_term, case=False, na=False) |
-                df['nama_propinsi'].str.contains(search_term, case=False, na=False) |
-                df['nama_kota'].str.contains(search_term, case=False, na=False)
-            ]
+            search_df = df[df['_search_blob'].str.contains(search_term.lower(), regex=False, na=False)]
         else:
             search_df = df
 
-        # Format date to only show DD/MM/YYYY
-        search_df['tgl_pasang_str'] = search_df['tgl_pasang'].dt.strftime('%d/%m/%Y')
-        
         # Display sites table
         display_columns = ['id_station', 'name_station', 'nama_propinsi', 'nama_kota', 'latt_station', 'long_station', 'elv_station', 'hp_petugas', 'instansi', 'tgl_pasang_str', 'nama_vendor']
         st.dataframe(
-            search_df[display_columns].sort_values('id_station'),
+            search_df[display_columns],
             use_container_width=True,
             column_config={
                 'id_station': 'Site ID',
@@ -533,7 +740,7 @@ def main():
                 </span>
                 """, unsafe_allow_html=True)
 
-                csv = search_df.copy()
+                csv = search_df.drop(columns=INTERNAL_COLS)
                 csv['hp_petugas'] = csv['hp_petugas'].astype(str).str.strip()  # optional: ensure it's string
                 csv_data = csv.to_csv(index=False)
 
@@ -545,18 +752,16 @@ def main():
                 )
 
             with col2:
-                # XLSX export: Directly use the original file
-                try:
-                    with open("Metadata ALL - Sheet.xlsx", "rb") as f:
-                        xlsx_data = f.read()
-
+                # XLSX export: Directly use the original file (read once per workbook version)
+                xlsx_data = load_file_bytes(METADATA_FILE, data_version)
+                if xlsx_data is not None:
                     st.download_button(
                         label="⬇️ Download XLSX",
                         data=xlsx_data,
                         file_name=f"Observation_Station_Data_{pd.Timestamp.now().strftime('%Y%m%d')}.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
-                except FileNotFoundError:
+                else:
                     st.error("❌ The original Excel file was not found.")
 
 main()